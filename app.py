@@ -1,15 +1,57 @@
 import streamlit as st
-import nest_asyncio
-from llama_index.core import Settings
+import asyncio
+import diskcache
+import html
+import logging
 from llama_index.llms.sambanovasystems import SambaNovaCloud
 from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import DuckDuckGoSearchException, RatelimitException, TimeoutException
 from llama_index.core.tools import FunctionTool
 from llama_index.agent.lats import LATSAgentWorker
 from llama_index.core.agent import AgentRunner
+from llama_index.core.agent.react.types import ActionReasoningStep
+import metrics
+from metrics import timed
+import numpy as np
 import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
 
-# Apply nest_asyncio
-nest_asyncio.apply()
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # semantic cache tier is optional: pip install sentence-transformers
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+# Search cache settings: entries are fresh for SEARCH_CACHE_TTL and kept
+# as a stale fallback for rate-limited searches until SEARCH_CACHE_EXPIRE
+SEARCH_CACHE_DIR = "./.ddg_cache"
+SEARCH_CACHE_TTL = 6 * 3600
+SEARCH_CACHE_EXPIRE = 7 * 24 * 3600
+
+# Search retry settings: each attempt rotates through the DDG backends,
+# with exponential backoff between attempts
+SEARCH_BACKENDS = ("html", "lite")
+SEARCH_MAX_ATTEMPTS = 4
+
+# Limits on search context fed back into the agent
+SNIPPET_MAX_CHARS = 300
+CONTEXT_MAX_CHARS = 1500
+SEARCH_BATCH_MAX_QUERIES = 3
+
+# Prefix of the message returned when a recommendation fails
+RECOMMENDATION_ERROR = "An error occurred while processing your request"
+
+# Seconds a duplicate request waits for an identical in-flight agent run
+INFLIGHT_TIMEOUT = 300
+
+# Semantic cache settings
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92
 
 # Product category configurations
 PRODUCT_CATEGORIES = {
@@ -114,12 +156,24 @@ PRODUCT_CATEGORIES = {
     }
 }
 
-def initialize_llm():
-    """Initialize the SambaNova LLM with specific parameters"""
+# SambaNova models offered in the sidebar
+MODELS = {
+    "Fast (8B)": "Meta-Llama-3.1-8B-Instruct",
+    "Quality (70B)": "Meta-Llama-3.1-70B-Instruct"
+}
+
+# Widget options derived once at import time
+CATEGORY_NAMES = tuple(PRODUCT_CATEGORIES)
+FEATURES = {name: tuple(config["features"]) for name, config in PRODUCT_CATEGORIES.items()}
+
+@st.cache_resource(show_spinner=False)
+def initialize_llm(api_key: str, model: str):
+    """Initialize the SambaNova LLM with specific parameters (one client per API key and model)"""
     return SambaNovaCloud(
-        model="Meta-Llama-3.1-70B-Instruct",
-        context_window=10000,
-        max_tokens=2048,
+        model=model,
+        sambanova_api_key=api_key,
+        context_window=4096,
+        max_tokens=512,
         temperature=0.1,
         top_k=1,
         top_p=0.95,
@@ -130,6 +184,93 @@ def initialize_llm():
     )
 
 
+@st.cache_resource(show_spinner=False)
+def get_search_cache():
+    """Open the on-disk search cache shared by all sessions"""
+    return diskcache.Cache(SEARCH_CACHE_DIR)
+
+def _ddg_error_kind(error: DuckDuckGoSearchException) -> str:
+    """
+    Classify a DuckDuckGo error as "ratelimit", "timeout" or "error".
+    DDGS.text re-raises the last backend error wrapped in the base exception,
+    so the original exception is looked up in its args.
+    """
+    cause = error.args[0] if error.args and isinstance(error.args[0], Exception) else error
+    if isinstance(cause, RatelimitException):
+        return "ratelimit"
+    if isinstance(cause, TimeoutException):
+        return "timeout"
+    return "error"
+
+def _ddg_text(query: str) -> list:
+    """Query DuckDuckGo, retrying rate limits and timeouts across backends with backoff"""
+    error = None
+    for attempt in range(SEARCH_MAX_ATTEMPTS):
+        for backend in SEARCH_BACKENDS:
+            try:
+                # A fresh client per call: html/lite need no vqd token, and a reused
+                # DDGS throttles itself for 0.75s after any request in the last 20s
+                req = DDGS(proxy=os.environ.get("DDG_PROXY"))
+                response = req.text(query, max_results=4, backend=backend)
+                metrics.DDG_REQUESTS.labels(status="ok").inc()
+                return response
+            except DuckDuckGoSearchException as e:
+                kind = _ddg_error_kind(e)
+                metrics.DDG_REQUESTS.labels(status=kind).inc()
+                if kind == "error":
+                    raise
+                error = e
+        if attempt < SEARCH_MAX_ATTEMPTS - 1:
+            time.sleep(2 ** attempt + random.random())
+    raise error
+
+def _format_results(response: list) -> str:
+    """Unescape, deduplicate and truncate search snippets into a bounded context"""
+    parts = []
+    seen = set()
+    for result in response:
+        snippet = html.unescape(result.get('body', ''))[:SNIPPET_MAX_CHARS]
+        if snippet[:64] in seen:
+            continue
+        seen.add(snippet[:64])
+        parts.append(snippet)
+    return "\n".join(parts)[:CONTEXT_MAX_CHARS]
+
+def _search_one(query: str) -> str:
+    """Run a single blocking DuckDuckGo text search, served from the disk cache when fresh"""
+    cache = get_search_cache()
+    key = query.strip().lower()
+    cached = cache.get(key, default=None, retry=True)
+    if cached is not None and time.time() - cached[0] < SEARCH_CACHE_TTL:
+        return cached[1]
+    try:
+        response = _ddg_text(query)
+    except DuckDuckGoSearchException as e:
+        if cached is not None:
+            return cached[1]
+        return f"Search failed: {str(e)}"
+    except Exception as e:
+        return f"Search failed: {str(e)}"
+    context = _format_results(response)
+    cache.set(key, (time.time(), context), expire=SEARCH_CACHE_EXPIRE, retry=True)
+    return context
+
+@st.cache_resource(show_spinner=False)
+def get_event_loop():
+    """Start the dedicated background event loop used for async work"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+def run_async(coro):
+    """Run a coroutine on the background event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+async def _search_many(queries: List[str]) -> List[str]:
+    """Run several searches concurrently, one worker thread per query"""
+    return await asyncio.gather(*[asyncio.to_thread(_search_one, q) for q in queries])
+
+@timed
 def search(query: str) -> str:
     """
     Perform DuckDuckGo search
@@ -138,51 +279,226 @@ def search(query: str) -> str:
     return:
         context (str): search results to the user query
     """
+    metrics.SEARCH_CALLS.labels(tool="search").inc()
+    return run_async(_search_many([query]))[0]
+
+@timed
+def search_batch(queries: List[str]) -> str:
+    """
+    Perform up to SEARCH_BATCH_MAX_QUERIES DuckDuckGo searches concurrently
+    Args:
+        queries: list of search queries; duplicates and extra queries are dropped
+    return:
+        context (str): search results grouped per query, capped at CONTEXT_MAX_CHARS
+    """
+    metrics.SEARCH_CALLS.labels(tool="search_batch").inc()
+    queries = list(dict.fromkeys(queries))[:SEARCH_BATCH_MAX_QUERIES]
+    results = run_async(_search_many(queries))
+    return "\n\n".join(f"Results for '{q}':\n{r}" for q, r in zip(queries, results))[:CONTEXT_MAX_CHARS]
+
+@st.cache_resource(show_spinner=False)
+def setup_agent(api_key: str, deep: bool, model: str):
+    """
+    Setup the LATS agent with search tool.
+    Cached per API key, search depth and model so the agent is built once and shared across
+    reruns and sessions; exceptions propagate so a failed setup is not cached.
+    The default runs one expansion over two rollouts (search, then answer);
+    deep mode runs two expansions per rollout.
+    """
+    llm = initialize_llm(api_key, model)
+    
+    search_tool = FunctionTool.from_defaults(
+        fn=search,
+        name="search",
+        description="Search for product information and reviews"
+    )
+    search_batch_tool = FunctionTool.from_defaults(
+        fn=search_batch,
+        name="search_batch",
+        description=f"Search up to {SEARCH_BATCH_MAX_QUERIES} queries at once"
+    )
+    
+    agent_worker = LATSAgentWorker(
+        tools=[search_tool, search_batch_tool],
+        num_expansions=2 if deep else 1,
+        max_rollouts=2,
+        verbose=True,
+        llm=llm
+    )
+    
+    return AgentRunner(agent_worker)
+
+def build_query(category: str, budget: int, features: tuple, custom_requirements: str) -> str:
+    """Build a normalized query so equivalent inputs map to the same cache entry"""
+    parts = [f"Looking for a {category.lower()} under ${budget}"]
+    if features:
+        parts.append(f" with {', '.join(sorted(features))}")
+    if custom_requirements.strip():
+        parts.append(f". Additional requirements: {custom_requirements.strip()}")
+    return "".join(parts).lower()
+
+@st.cache_resource(show_spinner=False)
+def get_embedder():
+    """Load the local embedding model used by the semantic cache, if available"""
+    if SentenceTransformer is None:
+        return None
+    try:
+        return SentenceTransformer(EMBEDDING_MODEL)
+    except Exception as e:  # e.g. the first-use model download fails offline
+        logger.warning("Semantic cache disabled, could not load %s: %s", EMBEDDING_MODEL, e)
+        return None
+
+def semantic_lookup(criteria: tuple, custom_requirements: str, agent_config: tuple):
+    """
+    Look up a previous response for the same criteria and semantically similar requirements
+    Args:
+        criteria: (category, budget, sorted features), which must match exactly
+        custom_requirements: free-text requirements, compared by embedding similarity
+        agent_config: agent settings the response must have been produced with
+    return:
+        (cached response or None, requirements embedding or None)
+    """
+    embedder = get_embedder()
+    if embedder is None or not custom_requirements:
+        return None, None
+    embedding = embedder.encode(custom_requirements, normalize_embeddings=True)
+    sem_cache = st.session_state.setdefault("sem_cache", {}).get((agent_config, criteria), [])
+    if sem_cache:
+        similarities = np.stack([emb for emb, _ in sem_cache]) @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] > SEMANTIC_CACHE_THRESHOLD:
+            return sem_cache[best][1], embedding
+    return None, embedding
+
+class AgentStillThinking(Exception):
+    """Raised when the agent ends without a final answer; carries its latest observation"""
+
+    def __init__(self, observation: str):
+        super().__init__(observation)
+        self.observation = observation
+
+def last_observation(task) -> str:
+    """Return the latest observation along the first branch of the task's search tree"""
     try:
-        req = DDGS()
-        response = req.text(query, max_results=4)
-        context = ""
-        for result in response:
-            context += result['body']
-        return context
-    except Exception as e:
-        return f"Search failed: {str(e)}"
+        node = task.extra_state["root_node"]
+        while node.children:
+            node = node.children[0]
+        return node.current_reasoning[-1].observation
+    except (AttributeError, IndexError, KeyError):
+        return "I am still thinking. No search results are available yet, please try again."
 
-def setup_agent():
-    """Setup the LATS agent with search tool"""
+def last_tool_call(task) -> str:
+    """Describe the newest tool call on the task's most promising branch, or "" if there is none"""
     try:
-        llm = initialize_llm()
-        Settings.llm = llm
-        
-        search_tool = FunctionTool.from_defaults(
-            fn=search,
-            name="search",
-            description="Search for product information and reviews"
-        )
-        
-        agent_worker = LATSAgentWorker(
-            tools=[search_tool],
-            num_expansions=2,
-            max_rollouts=2,
-            verbose=True,
-            llm=llm
-        )
-        
-        return AgentRunner(agent_worker)
+        reasoning = task.extra_state["root_node"].get_best_leaf().current_reasoning
+    except (AttributeError, KeyError):
+        return ""
+    for step in reversed(reasoning):
+        if isinstance(step, ActionReasoningStep):
+            return f"{step.action} {step.action_input}"[:100]
+    return ""
+
+def run_agent(query: str, agent: AgentRunner, status) -> str:
+    """
+    Run the LATS agent one rollout at a time, reporting each finished rollout and the
+    latest tool call on the status label.
+    Only status.update() is called here: it is not recorded by st.cache_data, so
+    cache hits do not replay a stale progress box.
+    Raises AgentStillThinking instead of returning a fallback, so it is never cached.
+    """
+    max_rollouts = agent.agent_worker.max_rollouts
+    task = agent.create_task(query)
+    rollout = 0
+    step_output = None
+    try:
+        while step_output is None or not step_output.is_last:
+            with metrics.STEP_LATENCY.labels(model=agent.agent_worker.llm.model).time():
+                step_output = agent.run_step(task.task_id)
+            rollout += 1
+            label = f"Rollout {rollout} of {max_rollouts} complete"
+            tool_call = last_tool_call(task)
+            if tool_call:
+                label += f" - last tool call: {tool_call}"
+            status.update(label=label)
+        response = agent.finalize_response(task.task_id).response
+    finally:
+        # The agent is shared across sessions, so drop each task's search tree when done
+        agent.delete_task(task.task_id)
+    metrics.ROLLOUTS.observe(rollout)
+    if "I am still thinking." in response:
+        raise AgentStillThinking(last_observation(task))
+    return response
+
+@st.cache_resource(show_spinner=False)
+def get_inflight_runs():
+    """Registry of agent runs in progress, shared across sessions"""
+    return {}, threading.Lock()
+
+def run_agent_once(query: str, agent_config: tuple, agent: AgentRunner, status) -> str:
+    """Run the agent, letting identical concurrent requests wait for the first run instead"""
+    inflight, lock = get_inflight_runs()
+    key = (query, agent_config)
+    with lock:
+        future = inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = inflight[key] = Future()
+    if not is_owner:
+        return future.result(timeout=INFLIGHT_TIMEOUT)
+    try:
+        with metrics.INFLIGHT_RUNS.track_inprogress():
+            future.set_result(run_agent(query, agent, status))
     except Exception as e:
-        st.error(f"Agent setup failed: {str(e)}")
-        return None
+        future.set_exception(e)
+    finally:
+        # Release waiters if the run was interrupted (e.g. by a Streamlit rerun)
+        future.cancel()
+        with lock:
+            inflight.pop(key, None)
+    return future.result()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_recommendation(criteria: tuple, custom_requirements: str, agent_config: tuple,
+                          _agent: AgentRunner, _status) -> str:
+    """
+    Exact-match cache in front of the semantic cache and the agent; exceptions, including
+    AgentStillThinking fallbacks, are not cached in either layer
+    Args:
+        criteria: (category, budget, sorted features)
+        custom_requirements: stripped free-text requirements
+        agent_config: agent settings the response is produced with
+        _status: st.status container created by the caller, used for progress updates
+    """
+    response, embedding = semantic_lookup(criteria, custom_requirements, agent_config)
+    if response is not None:
+        return response
+    query = build_query(*criteria, custom_requirements)
+    response = run_agent_once(query, agent_config, _agent, _status)
+    if embedding is not None:
+        st.session_state.sem_cache.setdefault((agent_config, criteria), []).append((embedding, response))
+    return response
 
-def process_recommendation(query: str, agent: AgentRunner):
-    """Process the recommendation query with error handling"""
+@timed
+def process_recommendation(category: str, budget: int, features: list, custom_requirements: str,
+                           agent: AgentRunner, agent_config: tuple):
+    """
+    Process the recommendation request with caching and error handling
+    return:
+        (text, is_final): is_final is False for errors and still-thinking fallbacks
+    """
     try:
-        response = agent.chat(query).response
-        if "I am still thinking." in response:
-            return agent.list_tasks()[-1].extra_state["root_node"].children[0].children[0].current_reasoning[-1].observation
-        else:
-            return response
+        criteria = (category, budget, tuple(sorted(features)))
+        with st.status("Analyzing current market offerings...") as status:
+            try:
+                response = cached_recommendation(criteria, custom_requirements.strip(), agent_config, agent, status)
+            except AgentStillThinking as e:
+                status.update(label="No final answer yet, showing the latest search findings",
+                              state="error", expanded=False)
+                return e.observation, False
+            status.update(label="Analysis complete", state="complete", expanded=False)
+        return response, True
     except Exception as e:
-        return f"An error occurred while processing your request: {str(e)}"
+        return f"{RECOMMENDATION_ERROR}: {str(e)}", False
 
 def main():
     st.set_page_config(page_title="Smart Product Recommendation System", layout="wide")
@@ -194,6 +510,9 @@ def main():
     Our AI-powered system analyzes current market offerings to find the best match for your needs.
     """)
     
+    # Start the metrics endpoint on the first run in this process
+    metrics.start_metrics_server()
+    
     # Initialize session state for agent
     if 'agent' not in st.session_state:
         st.session_state.agent = None
@@ -202,15 +521,22 @@ def main():
     with st.sidebar:
         st.header("Configuration")
         api_key = st.text_input("Enter SambaNova API Key:", type="password")
+        model_size = st.radio("Model", list(MODELS))
+        deep = st.checkbox("Deep search (slower, more thorough)", key="deep_mode")
+        model = MODELS[model_size]
+        agent_config = (deep, model)
         if api_key:
             os.environ["SAMBANOVA_API_KEY"] = api_key
-            if st.session_state.agent is None:
-                st.session_state.agent = setup_agent()
+            try:
+                st.session_state.agent = setup_agent(api_key, deep, model)
+            except Exception as e:
+                st.error(f"Agent setup failed: {str(e)}")
+                st.session_state.agent = None
     
     st.header("What are you looking for?")
     
     # Product category selection
-    category = st.selectbox("Select Product Category", list(PRODUCT_CATEGORIES.keys()))
+    category = st.selectbox("Select Product Category", CATEGORY_NAMES)
     
     # Create columns for input parameters
     col1, col2 = st.columns(2)
@@ -221,11 +547,14 @@ def main():
     with col2:
         features = st.multiselect(
             "Important Features",
-            PRODUCT_CATEGORIES[category]["features"]
+            FEATURES[category]
         )
     
     custom_requirements = st.text_area("Any additional requirements or preferences?", height=100)
     
+    # Identify the current inputs so an unchanged request is redisplayed, not recomputed
+    inputs_key = hash((category, budget, tuple(sorted(features)), custom_requirements.strip(), agent_config))
+    
     # Generate recommendations
     if st.button("Get Recommendations", type="primary"):
         if not api_key:
@@ -237,22 +566,28 @@ def main():
             return
             
         try:
-            # Construct the query
-            query = f"Looking for a {category.lower()} under ${budget}"
-            if features:
-                query += f" with {', '.join(features)}"
-            if custom_requirements:
-                query += f". Additional requirements: {custom_requirements}"
-            
-            with st.spinner("Analyzing current market offerings..."):
-                recommendation = process_recommendation(query, st.session_state.agent)
+            if st.session_state.get("last", (None,))[0] != inputs_key:
+                recommendation, is_final = process_recommendation(
+                    category, budget, features, custom_requirements, st.session_state.agent, agent_config
+                )
                 
-            # Display recommendations
-            st.header(f"🎯 Recommended {category}")
-            st.write(recommendation)
+                if is_final:
+                    st.session_state.last = (inputs_key, recommendation)
+                elif recommendation.startswith(RECOMMENDATION_ERROR):
+                    st.error(recommendation)
+                else:
+                    # Shown once but not memoized, so clicking again retries
+                    st.warning("The agent has not reached a final answer yet. "
+                               "Here are its latest search findings; click again to retry.")
+                    st.write(recommendation)
             
         except Exception as e:
             st.error(f"An error occurred: {str(e)}")
+    
+    # Display recommendations for the current inputs
+    if st.session_state.get("last", (None,))[0] == inputs_key:
+        st.header(f"🎯 Recommended {category}")
+        st.write(st.session_state.last[1])
             
     # Help section
     with st.expander("Need Help?"):
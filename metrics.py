@@ -0,0 +1,46 @@
+"""
+Prometheus metrics for the recommendation app.
+Kept out of app.py because Streamlit re-executes the main script on every rerun
+and cache clear, and prometheus_client rejects registering the same metric twice;
+an imported module is executed once per process.
+"""
+import functools
+import logging
+import os
+import threading
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Port of the Prometheus /metrics endpoint
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 8001))
+
+FUNCTION_LATENCY = Histogram("function_latency_seconds", "Wall time of instrumented functions", ["function"])
+DDG_REQUESTS = Counter("ddg_requests_total", "DuckDuckGo requests by outcome", ["status"])
+SEARCH_CALLS = Counter("search_tool_calls_total", "Search tool calls made by the agent", ["tool"])
+STEP_LATENCY = Histogram("agent_step_seconds", "Wall time of a single LATS rollout", ["model"])
+ROLLOUTS = Histogram("rollouts_per_query", "LATS rollouts run per query", buckets=(1, 2, 3, 5, 8))
+INFLIGHT_RUNS = Gauge("agent_runs_in_flight", "Agent runs currently executing")
+
+logger = logging.getLogger(__name__)
+_server_lock = threading.Lock()
+_server_started = False
+
+def start_metrics_server():
+    """Start the /metrics endpoint, at most once per process"""
+    global _server_started
+    with _server_lock:
+        if _server_started:
+            return
+        _server_started = True
+        try:
+            start_http_server(METRICS_PORT)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on port %s: %s", METRICS_PORT, e)
+
+def timed(fn):
+    """Record the wall time of each call to fn in function_latency_seconds"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with FUNCTION_LATENCY.labels(function=fn.__name__).time():
+            return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,117 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+class FakeStatus:
+    """Records the labels an st.status container is updated with"""
+
+    def __init__(self):
+        self.labels = []
+
+    def update(self, label=None, **kwargs):
+        self.labels.append(label)
+
+
+class FakeAgent:
+    """Minimal stand-in for AgentRunner that finishes after a fixed number of steps"""
+
+    def __init__(self, responses, fail_at=None):
+        self.responses = responses
+        self.fail_at = fail_at
+        self.tasks = {}
+        self.agent_worker = SimpleNamespace(max_rollouts=len(responses), llm=SimpleNamespace(model="fake"))
+
+    def create_task(self, query):
+        leaf = SimpleNamespace(children=[], current_reasoning=[SimpleNamespace(observation="leaf observation")])
+        task = SimpleNamespace(task_id=f"task-{len(self.tasks)}", extra_state={"root_node": SimpleNamespace(children=[leaf])})
+        self.tasks[task.task_id] = {"task": task, "step": 0}
+        return task
+
+    def run_step(self, task_id):
+        state = self.tasks[task_id]
+        if state["step"] == self.fail_at:
+            raise RuntimeError("LLM call failed")
+        response = self.responses[state["step"]]
+        state["step"] += 1
+        return SimpleNamespace(is_last=state["step"] == len(self.responses),
+                               output=SimpleNamespace(response=response))
+
+    def finalize_response(self, task_id):
+        state = self.tasks[task_id]
+        return SimpleNamespace(response=self.responses[state["step"] - 1])
+
+    def delete_task(self, task_id):
+        self.tasks.pop(task_id)
+
+
+def test_run_agent_returns_answer_and_deletes_task():
+    agent = FakeAgent(["I am still thinking.", "Buy the X100"])
+    status = FakeStatus()
+
+    assert app.run_agent("cameras", agent, status) == "Buy the X100"
+    assert status.labels == ["Rollout 1 of 2 complete", "Rollout 2 of 2 complete"]
+    assert agent.tasks == {}
+
+
+def test_run_agent_falls_back_to_own_task_observation():
+    agent = FakeAgent(["I am still thinking."])
+    other = agent.create_task("someone else's query")
+
+    with pytest.raises(app.AgentStillThinking) as excinfo:
+        app.run_agent("cameras", agent, FakeStatus())
+    assert excinfo.value.observation == "leaf observation"
+    assert list(agent.tasks) == [other.task_id]
+
+
+def test_run_agent_deletes_task_on_failure():
+    agent = FakeAgent(["I am still thinking.", "Buy the X100"], fail_at=1)
+
+    with pytest.raises(RuntimeError):
+        app.run_agent("cameras", agent, FakeStatus())
+    assert agent.tasks == {}
+
+
+@pytest.fixture
+def fake_status(monkeypatch):
+    @contextmanager
+    def status(label, **kwargs):
+        yield FakeStatus()
+
+    monkeypatch.setattr(app.st, "status", status)
+    app.cached_recommendation.clear()
+    yield
+    app.cached_recommendation.clear()
+
+
+def test_fallback_is_not_cached(fake_status):
+    agent = FakeAgent(["I am still thinking.", "I am still thinking."])
+    config = (False, "fake")
+
+    first = app.process_recommendation("Cameras", 1000, [], "", agent, config)
+    agent.responses = ["I am still thinking.", "Buy the X100"]
+    second = app.process_recommendation("Cameras", 1000, [], "", agent, config)
+
+    assert first == ("leaf observation", False)
+    assert second == ("Buy the X100", True)
+
+
+def test_answer_is_cached(fake_status):
+    agent = FakeAgent(["I am still thinking.", "Buy the X100"])
+    config = (False, "fake")
+
+    app.process_recommendation("Cameras", 1000, [], "", agent, config)
+    agent.responses = ["I am still thinking.", "Buy the Z6"]
+
+    assert app.process_recommendation("Cameras", 1000, [], "", agent, config) == ("Buy the X100", True)
+
+
+def test_progress_label_shows_latest_tool_call():
+    action = app.ActionReasoningStep(thought="Need prices", action="search", action_input={"query": "x100 price"})
+    leaf = SimpleNamespace(current_reasoning=[action])
+    task = SimpleNamespace(extra_state={"root_node": SimpleNamespace(get_best_leaf=lambda: leaf)})
+
+    assert app.last_tool_call(task) == "search {'query': 'x100 price'}"
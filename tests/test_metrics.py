@@ -0,0 +1,36 @@
+import os
+import runpy
+
+from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import RatelimitException
+from prometheus_client import REGISTRY
+
+import app
+
+APP_PATH = os.path.join(os.path.dirname(app.__file__), "app.py")
+
+
+def ddg_requests(status):
+    return REGISTRY.get_sample_value("ddg_requests_total", {"status": status}) or 0.0
+
+
+def test_rerunning_app_script_keeps_metrics_registered():
+    # Streamlit re-executes the script on every rerun and cache clear
+    runpy.run_path(APP_PATH, run_name="rerun")
+    runpy.run_path(APP_PATH, run_name="rerun")
+
+
+def test_ddg_outcomes_are_counted(monkeypatch):
+    def rate_limited(self, *args, **kwargs):
+        raise RatelimitException("https://html.duckduckgo.com/html 202 Ratelimit")
+
+    monkeypatch.setattr(app.time, "sleep", lambda seconds: None)
+    monkeypatch.setattr(DDGS, "_sleep", lambda self, sleeptime=0.75: None)
+    monkeypatch.setattr(DDGS, "_text_html", rate_limited)
+    monkeypatch.setattr(DDGS, "_text_lite", lambda self, *args, **kwargs: [])
+    ok, ratelimit = ddg_requests("ok"), ddg_requests("ratelimit")
+
+    app._ddg_text("camera")
+
+    assert ddg_requests("ok") == ok + 1
+    assert ddg_requests("ratelimit") == ratelimit + 1
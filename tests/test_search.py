@@ -0,0 +1,119 @@
+import diskcache
+import pytest
+from duckduckgo_search import DDGS
+from duckduckgo_search.exceptions import DuckDuckGoSearchException, RatelimitException
+
+import app
+
+RESULTS = [{"title": "Camera review", "href": "https://example.com", "body": "A great low light camera"}]
+
+
+def rate_limited(self, *args, **kwargs):
+    raise RatelimitException("https://html.duckduckgo.com/html 202 Ratelimit")
+
+
+@pytest.fixture
+def search_cache(monkeypatch, tmp_path):
+    """Point the search cache at a throwaway directory"""
+    cache = diskcache.Cache(str(tmp_path))
+    monkeypatch.setattr(app, "get_search_cache", lambda: cache)
+    yield cache
+    cache.close()
+
+
+@pytest.fixture(autouse=True)
+def sleeps(monkeypatch):
+    """Record backoff sleeps instead of waiting, and disable DDGS's own throttle"""
+    recorded = []
+    monkeypatch.setattr(app.time, "sleep", recorded.append)
+    monkeypatch.setattr(DDGS, "_sleep", lambda self, sleeptime=0.75: None)
+    return recorded
+
+
+def test_rate_limited_backend_rotates_to_next(monkeypatch, sleeps):
+    monkeypatch.setattr(DDGS, "_text_html", rate_limited)
+    monkeypatch.setattr(DDGS, "_text_lite", lambda self, *args, **kwargs: RESULTS)
+
+    assert app._ddg_text("camera") == RESULTS
+    assert sleeps == []
+
+
+def test_rate_limit_retried_with_backoff(monkeypatch, sleeps):
+    calls = []
+
+    def recovers(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) < 3:
+            rate_limited(self)
+        return RESULTS
+
+    monkeypatch.setattr(DDGS, "_text_html", recovers)
+    monkeypatch.setattr(DDGS, "_text_lite", rate_limited)
+
+    assert app._ddg_text("camera") == RESULTS
+    assert len(calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_rate_limit_gives_up_after_max_attempts(monkeypatch, sleeps):
+    monkeypatch.setattr(DDGS, "_text_html", rate_limited)
+    monkeypatch.setattr(DDGS, "_text_lite", rate_limited)
+
+    with pytest.raises(DuckDuckGoSearchException) as excinfo:
+        app._ddg_text("camera")
+    assert app._ddg_error_kind(excinfo.value) == "ratelimit"
+    assert len(sleeps) == app.SEARCH_MAX_ATTEMPTS - 1
+
+
+def test_other_errors_are_not_retried(monkeypatch, sleeps):
+    calls = []
+
+    def broken(self, *args, **kwargs):
+        calls.append(args)
+        raise DuckDuckGoSearchException("unexpected response")
+
+    monkeypatch.setattr(DDGS, "_text_html", broken)
+    monkeypatch.setattr(DDGS, "_text_lite", broken)
+
+    with pytest.raises(DuckDuckGoSearchException):
+        app._ddg_text("camera")
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_rate_limited_search_falls_back_to_stale_cache(monkeypatch, search_cache):
+    monkeypatch.setattr(DDGS, "_text_html", rate_limited)
+    monkeypatch.setattr(DDGS, "_text_lite", rate_limited)
+    search_cache.set("camera", (app.time.time() - app.SEARCH_CACHE_TTL - 1, "stale context"))
+
+    assert app._search_one("Camera") == "stale context"
+
+
+def test_rate_limited_search_without_cache_reports_failure(monkeypatch, search_cache):
+    monkeypatch.setattr(DDGS, "_text_html", rate_limited)
+    monkeypatch.setattr(DDGS, "_text_lite", rate_limited)
+
+    assert app._search_one("camera").startswith("Search failed:")
+
+
+def test_search_result_is_cached(monkeypatch, search_cache):
+    monkeypatch.setattr(DDGS, "_text_html", lambda self, *args, **kwargs: RESULTS)
+
+    assert app._search_one("camera") == "A great low light camera"
+    monkeypatch.setattr(DDGS, "_text_html", rate_limited)
+    assert app._search_one("camera") == "A great low light camera"
+
+
+def test_search_batch_caps_queries_and_context(monkeypatch):
+    searched = []
+
+    def fake_search_one(query):
+        searched.append(query)
+        return "x" * app.CONTEXT_MAX_CHARS
+
+    monkeypatch.setattr(app, "_search_one", fake_search_one)
+
+    context = app.search_batch(["a", "a", "b", "c", "d", "e"])
+
+    assert sorted(searched) == ["a", "b", "c"]
+    assert len(context) == app.CONTEXT_MAX_CHARS
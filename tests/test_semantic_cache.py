@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import streamlit as st
+
+import app
+
+CRITERIA = ("Cameras", 1000, ("4K Video",))
+CONFIG = (False, app.MODELS["Fast (8B)"])
+
+
+class FakeEmbedder:
+    """Embeds every text to the same vector, so any two requirements look identical"""
+
+    def encode(self, text, normalize_embeddings=True):
+        return np.array([1.0, 0.0])
+
+
+@pytest.fixture
+def embedder(monkeypatch):
+    monkeypatch.setattr(app, "get_embedder", lambda: FakeEmbedder())
+    st.session_state.sem_cache = {(CONFIG, CRITERIA): [(np.array([1.0, 0.0]), "cached answer")]}
+    yield
+    del st.session_state.sem_cache
+
+
+def test_similar_requirements_with_same_criteria_hit(embedder):
+    response, _ = app.semantic_lookup(CRITERIA, "for travel vlogs", CONFIG)
+    assert response == "cached answer"
+
+
+def test_changed_budget_never_hits(embedder):
+    response, embedding = app.semantic_lookup(("Cameras", 5000, ("4K Video",)), "for travel vlogs", CONFIG)
+    assert response is None
+    assert embedding is not None
+
+
+def test_changed_agent_config_never_hits(embedder):
+    response, _ = app.semantic_lookup(CRITERIA, "for travel vlogs", (True, app.MODELS["Fast (8B)"]))
+    assert response is None
+
+
+def test_empty_requirements_skip_semantic_tier(embedder):
+    assert app.semantic_lookup(CRITERIA, "", CONFIG) == (None, None)
+
+
+def test_embedder_load_failure_disables_tier(monkeypatch):
+    def offline(name):
+        raise OSError("couldn't connect to huggingface.co")
+
+    monkeypatch.setattr(app, "SentenceTransformer", offline)
+    app.get_embedder.clear()
+    try:
+        assert app.get_embedder() is None
+    finally:
+        app.get_embedder.clear()